@@ -84,7 +84,7 @@ Options:
   --spectral-louvain-basis <basis>                 Basis used for KMeans clustering. Can be 'pca' or 'diffmap'. If 'diffmap' is not calculated, use 'pca' instead. [default: diffmap]
   --spectral-louvain-nclusters <number>            Number of first level clusters for Kmeans. [default: 30]
   --spectral-louvain-nclusters2 <number>           Number of second level clusters for Kmeans. [default: 50]
-  --spectral-louvain-ninit <number>                Number of Kmeans tries for first level clustering. Default is the same as scikit-learn Kmeans function. [default: 10]
+  --spectral-louvain-ninit <number>                Number of Kmeans tries for first level clustering. [default: 1]
   --spectral-louvain-resolution <resolution>       Resolution parameter for louvain. [default: 1.3]
   --spectral-louvain-class-label <label>           Spectral-louvain label name in AnnData. [default: spectral_louvain_labels]
 
@@ -92,7 +92,7 @@ Options:
   --spectral-leiden-basis <basis>                  Basis used for KMeans clustering. Can be 'pca' or 'diffmap'. If 'diffmap' is not calculated, use 'pca' instead. [default: diffmap]
   --spectral-leiden-nclusters <number>             Number of first level clusters for Kmeans. [default: 30]
   --spectral-leiden-nclusters2 <number>            Number of second level clusters for Kmeans. [default: 50]
-  --spectral-leiden-ninit <number>                 Number of Kmeans tries for first level clustering. Default is the same as scikit-learn Kmeans function. [default: 10]
+  --spectral-leiden-ninit <number>                 Number of Kmeans tries for first level clustering. [default: 1]
   --spectral-leiden-resolution <resolution>        Resolution parameter for leiden. [default: 1.3]
   --spectral-leiden-class-label <label>            Spectral-leiden label name in AnnData. [default: spectral_leiden_labels]
 
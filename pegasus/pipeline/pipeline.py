@@ -307,13 +307,14 @@ def run_pipeline(input_file, output_name, **kwargs):
     # merge cite-seq data and run t-SNE
     if kwargs["cite_seq"]:
         adt_matrix = np.zeros((adata.shape[0], cdata.shape[1]), dtype="float32")
-        idx = adata.obs_names.isin(cdata.obs_names)
-        adt_matrix[idx, :] = cdata[adata.obs_names[idx],].X.toarray()
+        gidx = cdata.obs_names.get_indexer(adata.obs_names)
+        idx = gidx >= 0
+        adt_matrix[idx, :] = cdata.X[gidx[idx]].toarray()
         if abs(100.0 - kwargs["cite_seq_capping"]) > 1e-4:
             cite_seq.capping(adt_matrix, kwargs["cite_seq_capping"])
 
         var_names = np.concatenate(
-            [adata.var_names, ["AD-" + x for x in cdata.var_names]]
+            [adata.var_names, np.char.add("AD-", cdata.var_names.values.astype(str))]
         )
 
         new_data = anndata.AnnData(
@@ -20,7 +20,7 @@ from .nearest_neighbors import (
     calc_kBET,
     calc_kSIM,
 )
-from .graph_operations import construct_graph
+from .graph_operations import construct_graph, construct_aggregated_graph
 from .diffusion_map import diffmap, reduce_diffmap_to_3d
 from .pseudotime import calc_pseudotime, infer_path
 from .clustering import louvain, leiden, spectral_louvain, spectral_leiden
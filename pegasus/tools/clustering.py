@@ -1,29 +1,80 @@
 import time
+import random
+import weakref
+from contextlib import contextmanager
 import numpy as np
 import pandas as pd
 from anndata import AnnData
-from joblib import effective_n_jobs
-from natsort import natsorted
-
-import ctypes
-import ctypes.util
-
-try:
-    import louvain as louvain_module
-except ImportError:
-    print("Need louvain!")
-try:
-    import leidenalg
-except ImportError:
-    print("Need leidenalg!")
+from joblib import Parallel, delayed, effective_n_jobs
 from sklearn.cluster import KMeans
-from typing import List
+from typing import Iterator, List
 
-from pegasus.tools import construct_graph
+from pegasus.tools import construct_graph, construct_aggregated_graph
 import logging
 
 logger = logging.getLogger("pegasus")
 
+# Graph built from the affinity matrix of the last louvain/leiden call with cache_graph=True, keyed by (id(W), W.nnz).
+# W is held through a weak reference, and the entry is dropped as soon as W is freed.
+_GRAPH_CACHE = {}
+
+
+def _get_graph(W: "csr_matrix", cache_graph: bool) -> "igraph":
+    """ Return the igraph for W, reusing a cached one built from the same matrix. Cache the new graph only if cache_graph is True.
+    """
+    key = (id(W), W.nnz)
+    cached = _GRAPH_CACHE.get(key)
+    if cached is not None and cached[0]() is W:
+        logger.info("Reuse cached graph.")
+        return cached[1]
+
+    G = construct_graph(W)
+    if cache_graph:
+        _GRAPH_CACHE.clear()
+        _GRAPH_CACHE[key] = (weakref.ref(W, lambda ref: _GRAPH_CACHE.pop(key, None)), G)
+    return G
+
+
+@contextmanager
+def _igraph_random_state(random_state: int) -> Iterator[None]:
+    """ Let igraph draw from a private generator seeded with random_state, leaving Python's global random state untouched.
+    """
+    import igraph
+
+    igraph.set_random_number_generator(random.Random(random_state))
+    try:
+        yield
+    finally:
+        igraph.set_random_number_generator(random)  # igraph's default generator
+
+
+def _import_louvain() -> "module":
+    """ Import louvain lazily, as it loads a heavy C extension that most pegasus commands never use.
+    """
+    try:
+        import louvain as louvain_module
+    except ImportError:
+        raise ImportError("Need louvain! Try 'pip install louvain-github'.")
+    return louvain_module
+
+
+def _import_leidenalg() -> "module":
+    """ Import leidenalg lazily, for the same reason as _import_louvain.
+    """
+    try:
+        import leidenalg
+    except ImportError:
+        raise ImportError("Need leidenalg! Try 'pip install leidenalg'.")
+    return leidenalg
+
+
+def _set_cluster_labels(data: AnnData, membership: List[int], class_label: str) -> None:
+    """ Store 0-based cluster membership as categorical labels "1", "2", ... in data.obs[class_label].
+    """
+    uniq, codes = np.unique(np.asarray(membership, dtype=np.int32), return_inverse=True)
+    categories = (uniq + 1).astype(str)  # integer sort gives natural order
+    data.obs[class_label] = pd.Categorical.from_codes(codes.astype(np.int32), categories=categories)
+
 
 def louvain(
     data: AnnData,
@@ -31,6 +82,8 @@ def louvain(
     resolution: int = 1.3,
     random_state: int = 0,
     class_label: str = "louvain_labels",
+    flavor: str = "igraph",
+    cache_graph: bool = False,
 ) -> None:
     """Cluster the cells using Louvain algorithm.
 
@@ -51,6 +104,14 @@ def louvain(
     class_label: ``str``, optional, default: ``"louvain_labels"``
         Key name for storing cluster labels in ``data.obs``.
 
+    flavor: ``str``, optional, default: ``"igraph"``
+        Implementation of Louvain algorithm:
+            * ``"igraph"``: default setting. Use *python-igraph*'s built-in ``community_multilevel``, which runs entirely in C.
+            * ``"louvain"``: Use the *louvain* package, which reproduces results of earlier pegasus versions.
+
+    cache_graph: ``bool``, optional, default: ``False``
+        If ``True``, keep the graph built from the affinity matrix so that later louvain/leiden calls on the same matrix, e.g. a resolution sweep, skip rebuilding it. The graph stays in memory as long as the affinity matrix is alive.
+
     Returns
     -------
     ``None``
@@ -70,16 +131,22 @@ def louvain(
         raise ValueError("Cannot find affinity matrix. Please run neighbors first!")
     W = data.uns[rep_key]
 
-    G = construct_graph(W)
-    partition_type = louvain_module.RBConfigurationVertexPartition
-    partition = partition_type(G, resolution_parameter=resolution, weights="weight")
-    optimiser = louvain_module.Optimiser()
-    optimiser.set_rng_seed(random_state)
-    diff = optimiser.optimise_partition(partition)
-
-    labels = np.array([str(x + 1) for x in partition.membership])
-    categories = natsorted(np.unique(labels))
-    data.obs[class_label] = pd.Categorical(values=labels, categories=categories)
+    G = _get_graph(W, cache_graph)
+    if flavor == "igraph":
+        with _igraph_random_state(random_state):
+            partition = G.community_multilevel(
+                weights="weight", return_levels=False, resolution=resolution
+            )
+    else:
+        assert flavor == "louvain"
+        louvain_module = _import_louvain()
+        partition_type = louvain_module.RBConfigurationVertexPartition
+        partition = partition_type(G, resolution_parameter=resolution, weights="weight")
+        optimiser = louvain_module.Optimiser()
+        optimiser.set_rng_seed(random_state)
+        diff = optimiser.optimise_partition(partition)
+
+    _set_cluster_labels(data, partition.membership, class_label)
 
     end = time.time()
     logger.info("Louvain clustering is done. Time spent = {:.2f}s.".format(end - start))
@@ -92,6 +159,8 @@ def leiden(
     n_iter: int = -1,
     random_state: int = 0,
     class_label: str = "leiden_labels",
+    flavor: str = "igraph",
+    cache_graph: bool = False,
 ) -> None:
     """Cluster the data using Leiden algorithm.
 
@@ -115,6 +184,14 @@ def leiden(
     class_label: ``str``, optional, default: ``"leiden_labels"``
         Key name for storing cluster labels in ``data.obs``.
 
+    flavor: ``str``, optional, default: ``"igraph"``
+        Implementation of Leiden algorithm:
+            * ``"igraph"``: default setting. Use *python-igraph*'s built-in ``community_leiden`` with modularity as the objective, which runs entirely in C.
+            * ``"leidenalg"``: Use the *leidenalg* package, which reproduces results of earlier pegasus versions.
+
+    cache_graph: ``bool``, optional, default: ``False``
+        If ``True``, keep the graph built from the affinity matrix so that later louvain/leiden calls on the same matrix, e.g. a resolution sweep, skip rebuilding it. The graph stays in memory as long as the affinity matrix is alive.
+
     Returns
     -------
     ``None``
@@ -134,48 +211,85 @@ def leiden(
         raise ValueError("Cannot find affinity matrix. Please run neighbors first!")
     W = data.uns[rep_key]
 
-    G = construct_graph(W)
-    partition_type = leidenalg.RBConfigurationVertexPartition
-    partition = leidenalg.find_partition(
-        G,
-        partition_type,
-        seed=random_state,
-        weights="weight",
-        resolution_parameter=resolution,
-        n_iterations=n_iter,
-    )
+    G = _get_graph(W, cache_graph)
+    if flavor == "igraph":
+        with _igraph_random_state(random_state):
+            partition = G.community_leiden(
+                objective_function="modularity",
+                weights="weight",
+                resolution_parameter=resolution,
+                n_iterations=n_iter,
+            )
+    else:
+        assert flavor == "leidenalg"
+        leidenalg = _import_leidenalg()
+        partition_type = leidenalg.RBConfigurationVertexPartition
+        partition = leidenalg.find_partition(
+            G,
+            partition_type,
+            seed=random_state,
+            weights="weight",
+            resolution_parameter=resolution,
+            n_iterations=n_iter,
+        )
 
-    labels = np.array([str(x + 1) for x in partition.membership])
-    categories = natsorted(np.unique(labels))
-    data.obs[class_label] = pd.Categorical(values=labels, categories=categories)
+    _set_cluster_labels(data, partition.membership, class_label)
 
     end = time.time()
     logger.info("Leiden clustering is done. Time spent = {:.2f}s.".format(end - start))
 
 
+def _run_kmeans(
+    X: np.array, n_clusters: int, n_init: int, n_jobs: int, random_state: int, kmeans_backend: str
+) -> np.array:
+    """ Return KMeans labels of X computed by kmeans_backend, either "sklearn" or "faiss".
+    """
+    if kmeans_backend == "sklearn":
+        km = KMeans(n_clusters=n_clusters, n_jobs=n_jobs, n_init=n_init, random_state=random_state)
+        km.fit(X)
+        return km.labels_
+
+    assert kmeans_backend == "faiss"
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError("Need faiss! Try 'pip install faiss-cpu'.")
+
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n_threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(n_jobs)
+    try:
+        # Train on all points: by default faiss subsamples to 256 points per centroid and warns below 39 points per centroid
+        km = faiss.Kmeans(
+            X.shape[1],
+            n_clusters,
+            niter=20,
+            nredo=n_init,
+            seed=random_state,
+            max_points_per_centroid=X.shape[0],
+            min_points_per_centroid=1,
+        )
+        km.train(X)
+        _, labels = km.index.search(X, 1)
+    finally:
+        faiss.omp_set_num_threads(n_threads)
+    return labels[:, 0]
+
 
-def partition_cells_by_kmeans(data: AnnData, rep: str, n_jobs: int, n_clusters: int, n_clusters2: int, n_init: int, random_state: int) -> List[int]:
+def partition_cells_by_kmeans(data: AnnData, rep: str, n_jobs: int, n_clusters: int, n_clusters2: int, n_init: int, random_state: int, kmeans_backend: str = "sklearn") -> List[int]:
     start = time.time()
+    logger.info("partition_cells_by_kmeans uses {} KMeans.".format(kmeans_backend))
 
     n_jobs = effective_n_jobs(n_jobs)
 
     rep_key = "X_" + rep
-    X = data.obsm[rep_key].astype("float64")
-
-    km = KMeans(n_clusters=n_clusters, n_jobs=n_jobs, n_init = n_init, random_state=random_state)
-    km.fit(X)
-    coarse = km.labels_.copy()
+    # KMeans runs natively on float32, so only copy if the embedding is not already contiguous float32
+    X = np.ascontiguousarray(data.obsm[rep_key], dtype=np.float32)
 
-    km.set_params(n_init = 1)
-    labels = coarse.copy()
-    base_sum = 0
-    for i in range(n_clusters):
-        idx = coarse == i
-        nc = min(n_clusters2, idx.sum())
-        km.set_params(n_clusters=nc)
-        km.fit(X[idx,:])
-        labels[idx] = base_sum + km.labels_
-        base_sum += nc
+    coarse = _run_kmeans(X, n_clusters, n_init, n_jobs, random_state, kmeans_backend)
+    labels = _partition_clusters_by_kmeans(
+        X, coarse, n_clusters, n_clusters2, n_jobs, random_state, kmeans_backend
+    )
 
     end = time.time()
     logger.info("partition_cells_by_kmeans finished in {:.2f}s.".format(end - start))
@@ -183,6 +297,39 @@ def partition_cells_by_kmeans(data: AnnData, rep: str, n_jobs: int, n_clusters:
     return labels
 
 
+def _partition_clusters_by_kmeans(
+    X: np.array,
+    coarse: np.array,
+    n_clusters: int,
+    n_clusters2: int,
+    n_jobs: int,
+    random_state: int,
+    kmeans_backend: str,
+) -> np.array:
+    """ Split each of the n_clusters coarse clusters into at most n_clusters2 clusters. Return labels numbered contiguously from 0.
+    """
+    # Sort cells by coarse label once so that each partition is a contiguous block
+    order = np.argsort(coarse, kind="stable")
+    Xs = X[order]
+    starts = np.searchsorted(coarse[order], np.arange(n_clusters + 1))
+    nc_list = [min(n_clusters2, int(starts[i + 1] - starts[i])) for i in range(n_clusters)]
+    nonempty = [i for i in range(n_clusters) if nc_list[i] > 0]  # faiss's final assignment may leave a centroid without cells
+    sub_labels_list = Parallel(n_jobs=n_jobs)(
+        delayed(_run_kmeans)(Xs[starts[i] : starts[i + 1]], nc_list[i], 1, 1, random_state, kmeans_backend)
+        for i in nonempty
+    )
+
+    labels_sorted = np.empty_like(coarse)
+    base_sum = 0
+    for i, sub_labels in zip(nonempty, sub_labels_list):
+        labels_sorted[starts[i] : starts[i + 1]] = base_sum + sub_labels
+        base_sum += nc_list[i]
+    labels = np.empty_like(coarse)
+    labels[order] = labels_sorted
+
+    return labels
+
+
 
 def spectral_louvain(
     data: AnnData,
@@ -191,7 +338,8 @@ def spectral_louvain(
     rep_kmeans: str = "diffmap",
     n_clusters: int = 30,
     n_clusters2: int = 50,
-    n_init: int = 10,
+    n_init: int = 1,
+    kmeans_backend: str = "sklearn",
     n_jobs: int = -1,
     random_state: int = 0,
     class_label: str = "spectral_louvain_labels",
@@ -218,8 +366,13 @@ def spectral_louvain(
     n_clusters2: ``int``, optional, default: ``50``
         The number of second level clusters.
 
-    n_init: ``int``, optional, default: ``10``
-        Number of kmeans tries for the first level clustering. Default is set to be the same as scikit-learn Kmeans function.
+    n_init: ``int``, optional, default: ``1``
+        Number of kmeans tries for the first level clustering. A single k-means++ seeded run is usually sufficient, since the first level clusters are only seeds refined afterwards.
+
+    kmeans_backend: ``str``, optional, default: ``"sklearn"``
+        Implementation of KMeans used for both levels of clustering:
+            * ``"sklearn"``: default setting. Use *scikit-learn* KMeans.
+            * ``"faiss"``: Use *faiss* KMeans, which is faster on large data but gives different clusters than *scikit-learn* for the same ``random_state``. Requires ``pip install pegasuspy[faiss]``.
 
     n_jobs: ``int``, optional, default: ``-1``
         Number of threads to use. If ``-1``, use all available threads.
@@ -251,28 +404,23 @@ def spectral_louvain(
             raise ValueError("Please run {} first!".format(rep_kmeans))
     if "W_" + rep not in data.uns:
         raise ValueError("Cannot find affinity matrix. Please run neighbors first!")
+    louvain_module = _import_louvain()
 
     labels = partition_cells_by_kmeans(
-        data, rep_kmeans, n_jobs, n_clusters, n_clusters2, n_init, random_state,
+        data, rep_kmeans, n_jobs, n_clusters, n_clusters2, n_init, random_state, kmeans_backend,
     )
 
     W = data.uns["W_" + rep]
 
-    G = construct_graph(W)
+    G_agg = construct_aggregated_graph(W, labels)
     partition_type = louvain_module.RBConfigurationVertexPartition
-    partition = partition_type(
-        G, resolution_parameter=resolution, weights="weight", initial_membership=labels
-    )
-    partition_agg = partition.aggregate_partition()
+    partition_agg = partition_type(G_agg, resolution_parameter=resolution, weights="weight")
 
     optimiser = louvain_module.Optimiser()
     optimiser.set_rng_seed(random_state)
     diff = optimiser.optimise_partition(partition_agg)
-    partition.from_coarse_partition(partition_agg)
 
-    labels = np.array([str(x + 1) for x in partition.membership])
-    categories = natsorted(np.unique(labels))
-    data.obs[class_label] = pd.Categorical(values=labels, categories=categories)
+    _set_cluster_labels(data, np.asarray(partition_agg.membership)[labels], class_label)
 
     end = time.time()
     logger.info(
@@ -287,7 +435,8 @@ def spectral_leiden(
     rep_kmeans: str = "diffmap",
     n_clusters: int = 30,
     n_clusters2: int = 50,
-    n_init: int = 10,
+    n_init: int = 1,
+    kmeans_backend: str = "sklearn",
     n_jobs: int = -1,
     random_state: int = 0,
     class_label: str = "spectral_leiden_labels",
@@ -314,8 +463,13 @@ def spectral_leiden(
     n_clusters2: ``int``, optional, default: ``50``
         The number of second level clusters.
 
-    n_init: ``int``, optional, default: ``10``
-        Number of kmeans tries for the first level clustering. Default is set to be the same as scikit-learn Kmeans function.
+    n_init: ``int``, optional, default: ``1``
+        Number of kmeans tries for the first level clustering. A single k-means++ seeded run is usually sufficient, since the first level clusters are only seeds refined afterwards.
+
+    kmeans_backend: ``str``, optional, default: ``"sklearn"``
+        Implementation of KMeans used for both levels of clustering:
+            * ``"sklearn"``: default setting. Use *scikit-learn* KMeans.
+            * ``"faiss"``: Use *faiss* KMeans, which is faster on large data but gives different clusters than *scikit-learn* for the same ``random_state``. Requires ``pip install pegasuspy[faiss]``.
 
     n_jobs: ``int``, optional, default: ``-1``
         Number of threads to use. If ``-1``, use all available threads.
@@ -350,28 +504,23 @@ def spectral_leiden(
             raise ValueError("Please run {} first!".format(rep_kmeans))
     if "W_" + rep not in data.uns:
         raise ValueError("Cannot find affinity matrix. Please run neighbors first!")
+    leidenalg = _import_leidenalg()
 
     labels = partition_cells_by_kmeans(
-        data, rep_kmeans, n_jobs, n_clusters, n_clusters2, n_init, random_state,
+        data, rep_kmeans, n_jobs, n_clusters, n_clusters2, n_init, random_state, kmeans_backend,
     )
 
     W = data.uns["W_" + rep]
 
-    G = construct_graph(W)
+    G_agg = construct_aggregated_graph(W, labels)
     partition_type = leidenalg.RBConfigurationVertexPartition
-    partition = partition_type(
-        G, resolution_parameter=resolution, weights="weight", initial_membership=labels
-    )
-    partition_agg = partition.aggregate_partition()
+    partition_agg = partition_type(G_agg, resolution_parameter=resolution, weights="weight")
 
     optimiser = leidenalg.Optimiser()
     optimiser.set_rng_seed(random_state)
     diff = optimiser.optimise_partition(partition_agg, -1)
-    partition.from_coarse_partition(partition_agg)
 
-    labels = np.array([str(x + 1) for x in partition.membership])
-    categories = natsorted(np.unique(labels))
-    data.obs[class_label] = pd.Categorical(values=labels, categories=categories)
+    _set_cluster_labels(data, np.asarray(partition_agg.membership)[labels], class_label)
 
     end = time.time()
     logger.info(
@@ -1,8 +1,10 @@
 import time
+import weakref
 import numpy as np
 import logging
+from numba import njit, prange
 
-from scipy.sparse import issparse
+from scipy.sparse import issparse, csr_matrix
 from scipy.sparse.csgraph import connected_components
 from scipy.sparse.linalg import eigsh
 from scipy.stats import entropy
@@ -16,19 +18,60 @@ from pegasus.tools import update_rep, W_from_rep
 logger = logging.getLogger("pegasus")
 
 
+@njit(parallel=True, cache=True)
+def _normalize_csr_data(
+    indptr: "np.array", indices: "np.array", data: "np.array", diag_half: "np.array"
+) -> "np.array":
+    """ Compute W[i, j] / (diag_half[i] * diag_half[j]) in one pass over the CSR data
+    """
+    scale = 1.0 / diag_half
+    W_norm_data = np.empty_like(data)
+    for i in prange(indptr.size - 1):
+        row_scale = scale[i]
+        for j in range(indptr[i], indptr[i + 1]):
+            W_norm_data[j] = data[j] * row_scale * scale[indices[j]]
+    return W_norm_data
+
+
+def calc_row_sums(W: "csr_matrix") -> "np.array":
+    """ Return row sums of W straight from the CSR buffers, i.e. W.sum(axis=1).A1
+    """
+    # Empty rows are skipped since reduceat cannot express empty segments
+    nonempty = np.diff(W.indptr) > 0
+    diag = np.zeros(W.shape[0], dtype=W.dtype)
+    diag[nonempty] = np.add.reduceat(W.data, W.indptr[:-1][nonempty])
+    return diag
+
+
 def calculate_normalized_affinity(
     W: "csr_matrix"
 ) -> Tuple["csr_matrix", "np.array", "np.array"]:
-    diag = W.sum(axis=1).A1
+    diag = calc_row_sums(W)
     diag_half = np.sqrt(diag)
-    W_norm = W.tocoo(copy=True)
-    W_norm.data /= diag_half[W_norm.row]
-    W_norm.data /= diag_half[W_norm.col]
-    W_norm = W_norm.tocsr()
+    W_norm = csr_matrix(
+        (_normalize_csr_data(W.indptr, W.indices, W.data, diag_half), W.indices, W.indptr),
+        shape=W.shape,
+    )
 
     return W_norm, diag, diag_half
 
 
+@njit(parallel=True, cache=True)
+def _calc_phi(
+    U: "np.array", diag_half: "np.array", Lambda_new: "np.array"
+) -> Tuple["np.array", "np.array"]:
+    """ Compute Phi = U / diag_half[:, np.newaxis] and Phi_pt = Phi * Lambda_new in one pass over U
+    """
+    Phi = np.empty(U.shape, dtype=U.dtype)
+    Phi_pt = np.empty(U.shape, dtype=U.dtype)
+    for i in prange(U.shape[0]):
+        inv = 1.0 / diag_half[i]
+        for j in range(U.shape[1]):
+            Phi[i, j] = U[i, j] * inv
+            Phi_pt[i, j] = Phi[i, j] * Lambda_new[j]
+    return Phi, Phi_pt
+
+
 def calc_von_neumann_entropy(lambdas: List[float], t: float) -> float:
     etas = 1.0 - lambdas ** t
     etas = etas / etas.sum()
@@ -54,11 +97,17 @@ def find_knee_point(x: List[float], y: List[float]) -> int:
     return knee
 
 
-def calculate_diffusion_map(
-    W: "csr_matrix", n_components: int, solver: str, random_state: int, max_t: int
-) -> Tuple["np.array", "np.array", "np.array"]:
-    assert issparse(W)
+# Eigenvalues and diag_half of the most recently used affinity matrix, keyed by (id(W), W.nnz, n_components, solver, random_state).
+# W is held through a weak reference, and the entry is dropped as soon as W is freed.
+# Eigenvectors are not kept; on a hit they are rebuilt from the previous X_phi.
+_EIGEN_CACHE = {}
+
 
+def calculate_eigen_decomposition(
+    W: "csr_matrix", n_components: int, solver: str, random_state: int
+) -> Tuple["np.array", "np.array", "np.array"]:
+    """ Return eigenvalues and eigenvectors of the normalized affinity matrix, with the first pair removed, and diag_half.
+    """
     nc, labels = connected_components(W, directed=True, connection="strong")
     logger.info("Calculating connected components is done.")
 
@@ -68,23 +117,64 @@ def calculate_diffusion_map(
     logger.info("Calculating normalized affinity matrix is done.")
 
     if solver == "eigsh":
-        np.random.seed(random_state)
-        v0 = np.random.uniform(-1.0, 1.0, W_norm.shape[0])
-        Lambda, U = eigsh(W_norm, k=n_components, v0=v0)
+        # Use a private generator so that the global NumPy random state is left untouched
+        v0 = np.random.RandomState(random_state).uniform(-1.0, 1.0, W_norm.shape[0])
+        # ARPACK defaults to machine precision (tol=0); 1e-4 is ample for the downstream embeddings
+        Lambda, U = eigsh(W_norm, k=n_components, v0=v0, tol=1e-4)
         Lambda = Lambda[::-1]
         U = U[:, ::-1]
     else:
         assert solver == "randomized"
+        # randomized_svd is bound by SpMVs over W_norm.data, so run it in single precision
+        W_norm = csr_matrix(
+            (W_norm.data.astype(np.float32, copy=False), W_norm.indices, W_norm.indptr),
+            shape=W_norm.shape,
+        )
         U, S, VT = randomized_svd(
             W_norm, n_components=n_components, random_state=random_state
         )
+        # only the SpMVs run in single precision; downstream results stay float64
+        U = U.astype(np.float64, copy=False)
+        S = S.astype(np.float64, copy=False)
         signs = np.sign((U * VT.transpose()).sum(axis=0))  # get eigenvalue signs
         Lambda = signs * S  # get eigenvalues
-        
+
     # remove the first eigen value and vector
     Lambda = Lambda[1:]
     U = U[:, 1:]
-    Phi = U / diag_half[:, np.newaxis]
+
+    return Lambda, U, diag_half
+
+
+def calculate_diffusion_map(
+    W: "csr_matrix",
+    n_components: int,
+    solver: str,
+    random_state: int,
+    max_t: int,
+    Phi_prev: "np.array" = None,
+) -> Tuple["np.array", "np.array", "np.array"]:
+    """ If Phi_prev is the Phi returned by the last call on the same W and parameters, skip the eigen decomposition and recover U from it, as only max_t differs.
+    """
+    assert issparse(W)
+
+    key = (id(W), W.nnz, n_components, solver, random_state)
+    cached = _EIGEN_CACHE.get(key)
+    if (
+        cached is not None
+        and cached[0]() is W
+        and Phi_prev is not None
+        and Phi_prev.shape == (W.shape[0], n_components - 1)
+        and np.array_equal(Phi_prev[0], cached[3])
+    ):
+        logger.info("Reuse cached eigen decomposition.")
+        Lambda = cached[1].copy()
+        diag_half = cached[2]
+        U = Phi_prev * diag_half[:, np.newaxis]
+    else:
+        Lambda, U, diag_half = calculate_eigen_decomposition(
+            W, n_components, solver, random_state
+        )
 
     if max_t == -1:
         Lambda_new = Lambda / (1.0 - Lambda)
@@ -97,7 +187,15 @@ def calculate_diffusion_map(
 
         # U_df = U * Lambda #symmetric diffusion component
         Lambda_new = Lambda * ((1.0 - Lambda ** t) / (1.0 - Lambda)) 
-    Phi_pt = Phi * Lambda_new  # asym pseudo component
+    Phi, Phi_pt = _calc_phi(U, diag_half, Lambda_new)  # Phi_pt: asym pseudo component
+
+    _EIGEN_CACHE.clear()
+    _EIGEN_CACHE[key] = (
+        weakref.ref(W, lambda ref: _EIGEN_CACHE.pop(key, None)),
+        Lambda.copy(),
+        diag_half,
+        Phi[0].copy(),  # identifies the Phi this entry belongs to
+    )
 
     return Phi_pt, Lambda, Phi  # , U_df, W_norm
 
@@ -157,6 +255,7 @@ def diffmap(
         solver=solver,
         random_state=random_state,
         max_t = max_t,
+        Phi_prev=data.obsm["X_phi"] if "X_phi" in data.obsm.keys() else None,
     )
 
     data.obsm["X_diffmap"] = Phi_pt
@@ -1,6 +1,7 @@
 import time
 import numpy as np
-from scipy.sparse import issparse
+from scipy.sparse import issparse, coo_matrix
+from typing import List, Tuple
 try:
     import igraph
 except ImportError:
@@ -10,12 +11,11 @@ import logging
 logger = logging.getLogger("pegasus")
 
 
-def construct_graph(
+def get_graph_edges(
     W: "csr_matrix", directed: bool = False, adjust_weights: bool = True
-) -> "igraph":
-
-    start = time.time()
-
+) -> Tuple["np.array", "np.array", "np.array"]:
+    """ Return sources, targets and weights of the edges construct_graph builds from W.
+    """
     assert issparse(W)
 
     s, t = W.nonzero()
@@ -37,6 +37,17 @@ def construct_graph(
             t = t[idx]
             w = w[idx]
 
+    return s, t, w
+
+
+def construct_graph(
+    W: "csr_matrix", directed: bool = False, adjust_weights: bool = True
+) -> "igraph":
+
+    start = time.time()
+
+    s, t, w = get_graph_edges(W, directed=directed, adjust_weights=adjust_weights)
+
     G = igraph.Graph(directed=directed)
     G.add_vertices(W.shape[0])
     G.add_edges(zip(s, t))
@@ -46,3 +57,32 @@ def construct_graph(
     logger.info("Graph is constructed. Time spent = {:.2f}s.".format(end - start))
 
     return G
+
+
+def construct_aggregated_graph(W: "csr_matrix", labels: List[int]) -> "igraph":
+    """ Construct the graph of construct_graph(W) with each cluster in labels collapsed into one vertex.
+
+    Weights of edges between two clusters are summed and edges within a cluster become a self-loop, the same as louvain/leidenalg's aggregate_partition, but without building the full graph first.
+    """
+    start = time.time()
+
+    s, t, w = get_graph_edges(W)
+    labels = np.asarray(labels)
+    n_agg = labels.max() + 1
+    s_agg = labels[s]
+    t_agg = labels[t]
+    W_agg = coo_matrix(
+        (w, (np.minimum(s_agg, t_agg), np.maximum(s_agg, t_agg))), shape=(n_agg, n_agg)
+    ).tocsr().tocoo()  # sum up duplicate edges
+
+    G = igraph.Graph(directed=False)
+    G.add_vertices(n_agg)
+    G.add_edges(zip(W_agg.row, W_agg.col))
+    G.es["weight"] = W_agg.data
+
+    end = time.time()
+    logger.info(
+        "Aggregated graph is constructed. Time spent = {:.2f}s.".format(end - start)
+    )
+
+    return G
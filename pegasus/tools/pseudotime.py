@@ -1,6 +1,6 @@
 import time
 import numpy as np
-from sklearn.metrics.pairwise import euclidean_distances
+from sklearn.metrics.pairwise import euclidean_distances, pairwise_distances_chunked
 try:
     import igraph
 except ImportError as error:
@@ -46,9 +46,16 @@ def calc_pseudotime(data: AnnData, roots: List[str]) -> None:
 
     data.uns["roots"] = roots
     mask = np.isin(data.obs_names, data.uns["roots"])
-    distances = np.mean(
-        euclidean_distances(data.obsm["X_diffmap"][mask, :], data.obsm["X_diffmap"]),
-        axis=0,
+    # Only the mean distance to the roots is kept, so reduce each chunk instead of materializing the full distance matrix
+    distances = np.concatenate(
+        list(
+            pairwise_distances_chunked(
+                data.obsm["X_diffmap"],
+                data.obsm["X_diffmap"][mask, :],
+                reduce_func=lambda D_chunk, start: D_chunk.mean(axis=1),
+                metric="euclidean",
+            )
+        )
     )
     dmin = distances.min()
     dmax = distances.max()
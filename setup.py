@@ -31,7 +31,7 @@ requires = [
     "pyarrow",
     "umap-learn>=0.3.9",
     "lightgbm==2.2.1",
-    "python-igraph",
+    "python-igraph>=0.8",
     "MulticoreTSNE-modified",
     "hnswlib",
     "fisher-modified",
@@ -69,7 +69,7 @@ setup(
     keywords="single cell/nucleus genomics analysis",
     packages=find_packages(),
     install_requires=requires,
-    extras_require=dict(fitsne=["fitsne"], mkl=["mkl"]),
+    extras_require=dict(fitsne=["fitsne"], mkl=["mkl"], faiss=["faiss-cpu"]),
     python_requires="~=3.5",
     package_data={
         "pegasus.annotate_cluster": [
@@ -0,0 +1,52 @@
+import unittest
+
+import anndata
+import numpy as np
+from sklearn.cluster import KMeans
+
+from pegasus.tools.clustering import partition_cells_by_kmeans, _partition_clusters_by_kmeans
+
+
+class TestClustering(unittest.TestCase):
+    def setUp(self):
+        # four well-separated blobs of 50 cells each
+        rs = np.random.RandomState(0)
+        centers = np.array([[0, 0, 0], [10, 0, 0], [0, 10, 0], [0, 0, 10]], dtype=float)
+        self.blob = np.repeat(np.arange(4), 50)
+        coords = centers[self.blob] + rs.normal(scale=0.5, size=(self.blob.size, 3))
+        self.adata = anndata.AnnData(np.zeros((self.blob.size, 1)))
+        self.adata.obsm["X_blobs"] = coords
+        self.X = np.ascontiguousarray(coords, dtype=np.float32)
+
+    def test_partition_cells_by_kmeans(self):
+        n_clusters, n_clusters2, n_init, random_state = 4, 3, 1, 0
+        labels = partition_cells_by_kmeans(
+            self.adata, "blobs", 1, n_clusters, n_clusters2, n_init, random_state
+        )
+
+        # reference: the boolean-mask loop partition_cells_by_kmeans used before
+        coarse = KMeans(n_clusters=n_clusters, n_init=n_init, random_state=random_state).fit(self.X).labels_
+        expected = coarse.copy()
+        base_sum = 0
+        for i in range(n_clusters):
+            idx = coarse == i
+            nc = min(n_clusters2, idx.sum())
+            km = KMeans(n_clusters=nc, n_init=1, random_state=random_state).fit(self.X[idx, :])
+            expected[idx] = base_sum + km.labels_
+            base_sum += nc
+
+        np.testing.assert_array_equal(labels, expected)
+
+    def test_partition_with_empty_cluster(self):
+        # coarse cluster 2 has no cells
+        coarse = np.array([0, 1, 3, 3], dtype=np.int32)[self.blob]
+        labels = _partition_clusters_by_kmeans(self.X, coarse, 4, 3, 1, 0, "sklearn")
+
+        self.assertEqual(labels.size, self.blob.size)
+        np.testing.assert_array_equal(np.unique(labels), np.arange(9))
+        for label in np.unique(labels):
+            self.assertEqual(np.unique(coarse[labels == label]).size, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
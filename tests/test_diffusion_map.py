@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from pegasus.tools.diffusion_map import calc_row_sums, calculate_normalized_affinity
+
+
+class TestDiffusionMap(unittest.TestCase):
+    def test_calc_row_sums_with_empty_rows(self):
+        # rows 1 and 3 are empty in the middle, rows 5 and 6 are trailing empty rows
+        W = csr_matrix(
+            np.array(
+                [
+                    [0.0, 0.5, 1.0, 0.0, 0.0, 0.0, 0.0],
+                    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+                    [1.0, 0.0, 0.0, 0.0, 2.0, 0.0, 0.0],
+                    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+                    [0.0, 0.0, 2.0, 0.0, 0.0, 0.0, 3.0],
+                    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+                    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+                ]
+            )
+        )
+        np.testing.assert_allclose(calc_row_sums(W), W.sum(axis=1).A1)
+
+    def test_calculate_normalized_affinity(self):
+        W = csr_matrix(
+            np.array(
+                [
+                    [0.0, 0.5, 1.0, 0.0],
+                    [0.5, 0.0, 0.2, 0.7],
+                    [1.0, 0.2, 0.0, 2.0],
+                    [0.0, 0.7, 2.0, 0.0],
+                ]
+            )
+        )
+        W_norm, diag, diag_half = calculate_normalized_affinity(W)
+
+        # reference: the COO division used before normalization moved to a CSR kernel
+        diag_ref = W.sum(axis=1).A1
+        diag_half_ref = np.sqrt(diag_ref)
+        W_ref = W.tocoo(copy=True)
+        W_ref.data /= diag_half_ref[W_ref.row]
+        W_ref.data /= diag_half_ref[W_ref.col]
+        W_ref = W_ref.tocsr()
+
+        np.testing.assert_allclose(diag, diag_ref)
+        np.testing.assert_allclose(diag_half, diag_half_ref)
+        np.testing.assert_allclose(W_norm.toarray(), W_ref.toarray(), rtol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import importlib
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from pegasus.tools import construct_graph, construct_aggregated_graph
+
+
+def edge_weights(G):
+    weights = {}
+    for e in G.es:
+        key = (min(e.source, e.target), max(e.source, e.target))
+        weights[key] = weights.get(key, 0.0) + e["weight"]
+    return weights
+
+
+class TestGraphOperations(unittest.TestCase):
+    def setUp(self):
+        # two triangles {0, 1, 2} and {3, 4, 5} joined by edges 2-3 and 1-4
+        W = np.zeros((6, 6))
+        for i, j, w in [
+            (0, 1, 1.0), (0, 2, 2.0), (1, 2, 1.5),
+            (3, 4, 1.0), (3, 5, 0.5), (4, 5, 2.0),
+            (2, 3, 0.5), (1, 4, 1.0),
+        ]:
+            W[i, j] = W[j, i] = w
+        self.W = csr_matrix(W)
+        self.labels = np.array([0, 0, 1, 1, 2, 2])
+
+    def test_construct_aggregated_graph(self):
+        for module_name in ["louvain", "leidenalg"]:
+            with self.subTest(module=module_name):
+                try:
+                    module = importlib.import_module(module_name)
+                except ImportError:
+                    self.skipTest("Need {}!".format(module_name))
+
+                resolution = 1.3
+                partition = module.RBConfigurationVertexPartition(
+                    construct_graph(self.W),
+                    resolution_parameter=resolution,
+                    weights="weight",
+                    initial_membership=self.labels,
+                )
+                partition_agg = partition.aggregate_partition()
+
+                G_agg = construct_aggregated_graph(self.W, self.labels)
+                partition_new = module.RBConfigurationVertexPartition(
+                    G_agg, resolution_parameter=resolution, weights="weight"
+                )
+
+                expected = edge_weights(partition_agg.graph)
+                result = edge_weights(G_agg)
+                self.assertEqual(sorted(expected), sorted(result))
+                for key in expected:
+                    self.assertAlmostEqual(expected[key], result[key])
+                self.assertAlmostEqual(partition_new.quality(), partition_agg.quality())
+                self.assertAlmostEqual(partition_new.quality(), partition.quality())
+
+
+if __name__ == "__main__":
+    unittest.main()